@@ -1,7 +1,22 @@
+import itertools
 import math
+import os
+from collections import namedtuple
+from enum import IntEnum, IntFlag
 from typing import Dict, Optional, Tuple, List
+import numpy as np
 import streamlit as st
-import pandas as pd
+
+# JIT-kernerne ligger i et Streamlit-frit modul: numbas on-disk cache
+# genimporterer det definerende modul ved cache-hit, og det må ikke
+# re-eksekvere dette script (se score2_kernels.py).
+from score2_kernels import (
+    score2_batch_kernel as _score2_batch_kernel,
+    score2_scalar_kernel as _score2_scalar_kernel,
+)
+
+# pandas importeres først når en CSV faktisk skal parses (se load_csv_or_none);
+# fallback-stien med indbyggede bundter starter så uden pandas-importen.
 
 # =========================
 # APP CONFIG
@@ -38,8 +53,11 @@ with st.sidebar:
     st.subheader("📄 Eksempler")
     if st.button("Indlæs example_patients.csv"):
         try:
+            import pandas as pd
+            # DataFrame'en gemmes kolonnært; rækker dict-ificeres først ved valg,
+            # så session state ikke vokser med en liste af dicts per række.
             df_ex = pd.read_csv("example_patients.csv")
-            st.session_state["examples"] = df_ex.to_dict(orient="records")
+            st.session_state["examples_df"] = df_ex
             st.success(f"Indlæst {len(df_ex)} eksempler.")
         except Exception as e:
             st.error(f"Kunne ikke indlæse eksempler: {e}")
@@ -48,35 +66,19 @@ with st.sidebar:
 # DATA (SCORE2 CSV’er – cache)
 # =========================
 @st.cache_data
-def load_csv_or_none(path: str) -> Optional[pd.DataFrame]:
+def load_csv_or_none(path: str, mtime: float) -> Optional["pd.DataFrame"]:
+    # mtime indgår i cache-nøglen, så en opdateret CSV på disk slår igennem.
+    # mtime=0.0 betyder at filen mangler: returnér None uden at røre pandas.
+    if mtime <= 0.0:
+        return None
     try:
+        import pandas as pd
         return pd.read_csv(path)
     except Exception:
         return None
 
-coeff_df = load_csv_or_none("score2_coefficients.csv")
-baseline_df = load_csv_or_none("score2_baseline.csv")
-
-# Fallback værdier hvis CSV ikke findes (så appen altid virker)
-COEFFS_FALLBACK = pd.DataFrame({
-    "sex": ["M","M","M","M","M","M","M","M","M",
-            "F","F","F","F","F","F","F","F","F"],
-    "term": ["cage","csbp","ctc","chdl","smoke","cage*csbp","cage*ctc","cage*chdl","cage*smoke",
-             "cage","csbp","ctc","chdl","smoke","cage*csbp","cage*ctc","cage*chdl","cage*smoke"],
-    "coef": [0.3742,0.2777,0.1458,-0.2698,0.6012,-0.0255,-0.0281,0.0426,-0.0755,
-             0.4648,0.3131,0.1002,-0.2606,0.7744,-0.0277,-0.0226,0.0613,-0.1088]
-})
-BASELINE_FALLBACK = pd.DataFrame({
-    "sex":["M","F"],
-    "region":["NorthernEurope","NorthernEurope"],
-    "s0_10y":[0.9605,0.9776],
-    "scale1":[-0.5699,-0.7380],
-    "scale2":[0.7476,0.7019]
-})
-if coeff_df is None:
-    coeff_df = COEFFS_FALLBACK.copy()
-if baseline_df is None:
-    baseline_df = BASELINE_FALLBACK.copy()
+def _csv_mtime(path: str) -> float:
+    return os.path.getmtime(path) if os.path.exists(path) else 0.0
 
 # =========================
 # Hjælpefunktioner
@@ -84,7 +86,7 @@ if baseline_df is None:
 def clamp(v: float, lo: float, hi: float) -> float:
     return max(lo, min(hi, v))
 
-def age_adjusted_refs(age: int) -> Dict[str, Tuple[float, float]]:
+def _compute_refs(age: int) -> Dict[str, Tuple[float, float]]:
     # Enkel, pædagogisk aldersjustering (kan tilpasses lokale referencer)
     na_low, na_high = 137.0, 145.0
     k_low, k_high = 3.5, 5.0
@@ -97,91 +99,219 @@ def age_adjusted_refs(age: int) -> Dict[str, Tuple[float, float]]:
     egfr_low = 60.0
     return {"na": (na_low, na_high), "k": (k_low, k_high), "egfr": (egfr_low, expected), "urate": (0.20, 0.42)}
 
+# Referencer for alle relevante aldre beregnet én gang; opslag i stedet for
+# genberegning på hvert rerun. Indholdet (tuples) deles og må ikke muteres.
+_REFS_BY_AGE = tuple(_compute_refs(a) for a in range(18, 101))
+
+def age_adjusted_refs(age: int) -> Dict[str, Tuple[float, float]]:
+    return _REFS_BY_AGE[int(clamp(age, 18, 100)) - 18]
+
 def outside(ref: Tuple[float, float], val: Optional[float]) -> bool:
     if val is None:
         return False
     lo, hi = ref
     return val < lo or val > hi
 
+# Lab-nøgler og tilhørende alarmtekster i samme rækkefølge; bruges af den
+# vektoriserede range-test i alarmblokken.
+_LAB_KEYS = ("na", "k", "egfr", "urate")
+_LAB_MSGS = (
+    "Na⁺ uden for reference — undgå tiazider ved hyponatriæmi.",
+    "K⁺ uden for reference — RAAS/MRA kan give hyperkaliæmi.",
+    "eGFR under reference — tiazider mindre effektive ved eGFR <30; forsigtighed med MRA.",
+    "Urat forhøjet — tiazider kan forværre urinsyregigt.",
+)
+
 # =========================
 # SCORE2 beregning (CSV-drevet)
 # =========================
-def calculate_score2(age: int, sex_label: str, sbp: float, tc: float, hdl: float, smoker_label: str) -> Optional[float]:
-    sex_code = "M" if sex_label.startswith("M") else "F"
-    df = coeff_df[coeff_df["sex"].str.upper().str[0] == sex_code]
-    if df.empty:
+# Per-sex koefficientbundt: attributes i stedet for DataFrame-opslag i hot path.
+CoeffBundle = namedtuple(
+    "CoeffBundle",
+    "cage csbp ctc chdl smoke cage_csbp cage_ctc cage_chdl cage_smoke s0 scale1 scale2",
+)
+
+# Aliasser for term-navne i CSV'en → kanonisk feltnavn i CoeffBundle
+_TERM_ALIASES = {
+    "cage": "cage",
+    "csbp": "csbp",
+    "ctc": "ctc", "ctchol": "ctc",
+    "chdl": "chdl",
+    "smoke": "smoke", "current_smoker": "smoke",
+    "cage*csbp": "cage_csbp", "cage_csbp": "cage_csbp",
+    "cage*ctc": "cage_ctc", "cage_ctchol": "cage_ctc",
+    "cage*chdl": "cage_chdl", "cage_chdl": "cage_chdl",
+    "cage*smoke": "cage_smoke", "cage_smoker": "cage_smoke",
+}
+
+# Accepterede stavemåder for lavrisiko-regionen i baseline-CSV'en
+_REGION_SYNS = frozenset({"northerneurope", "low", "low-risk", "nordeuropa"})
+
+# Label-afkodning som opslagstabeller; nye labels kræver kun en tabel-post.
+_SEX_MAP = {"Mand": "M", "Kvinde": "F", "M": "M", "F": "F"}
+_SMOKER_MAP = {"Ja": 1.0, "Nej": 0.0}
+
+def _build_score2_bundles(coeffs: "pd.DataFrame", baseline: "pd.DataFrame") -> Dict[str, CoeffBundle]:
+    """Parser coefficient/baseline-CSV'erne én gang til plain-float bundter per køn."""
+    # Normalisér kolonnerne én gang og saml term→coef per køn via groupby
+    # i stedet for per-række iteration og gentagne boolean-masker.
+    coeffs = coeffs.assign(
+        sex=coeffs["sex"].str.upper().str[0],
+        term=coeffs["term"].astype(str).str.lower(),
+    )
+    term_maps = {sex: dict(zip(g["term"], g["coef"])) for sex, g in coeffs.groupby("sex")}
+
+    baseline = baseline.assign(
+        sex=baseline["sex"].str.upper().str[0],
+        region_norm=baseline["region"].str.lower(),
+    )
+
+    bundles: Dict[str, CoeffBundle] = {}
+    for sex_code in ("M", "F"):
+        raw_terms = term_maps.get(sex_code)
+        if not raw_terms:
+            continue
+        terms = {field: 0.0 for field in CoeffBundle._fields[:9]}
+        for raw, coef in raw_terms.items():
+            field = _TERM_ALIASES.get(raw)
+            if field is not None:
+                terms[field] = float(coef)
+
+        base = baseline[(baseline["sex"] == sex_code) & baseline["region_norm"].isin(_REGION_SYNS)]
+        if base.empty:
+            base = baseline[baseline["sex"] == sex_code]
+        if base.empty:
+            continue
+        row = base.iloc[0]
+        bundles[sex_code] = CoeffBundle(
+            **terms,
+            s0=float(row["s0_10y"]),
+            scale1=float(row["scale1"]),
+            scale2=float(row["scale2"]),
+        )
+    return bundles
+
+# Indbyggede værdier (NorthernEurope/lavrisiko) som plain floats, så
+# fallback-stien ikke bygger DataFrames eller kører .str-operationer.
+_BUILTIN_BUNDLES: Dict[str, CoeffBundle] = {
+    "M": CoeffBundle(
+        cage=0.3742, csbp=0.2777, ctc=0.1458, chdl=-0.2698, smoke=0.6012,
+        cage_csbp=-0.0255, cage_ctc=-0.0281, cage_chdl=0.0426, cage_smoke=-0.0755,
+        s0=0.9605, scale1=-0.5699, scale2=0.7476,
+    ),
+    "F": CoeffBundle(
+        cage=0.4648, csbp=0.3131, ctc=0.1002, chdl=-0.2606, smoke=0.7744,
+        cage_csbp=-0.0277, cage_ctc=-0.0226, cage_chdl=0.0613, cage_smoke=-0.1088,
+        s0=0.9776, scale1=-0.7380, scale2=0.7019,
+    ),
+}
+
+# Tabellerne bygges som en delt ressource: cache_resource gen-hasher ikke
+# resultatet på hvert rerun (i modsætning til cache_data), og output er alligevel
+# plain namedtuples/arrays, der behandles som read-only. mtime i nøglen gør, at
+# en opdateret CSV på disk stadig slår igennem.
+@st.cache_resource(show_spinner=False)
+def _score2_tables(coeff_mtime: float, base_mtime: float) -> Tuple[Dict[str, CoeffBundle], Dict[str, "np.ndarray"]]:
+    coeffs = load_csv_or_none("score2_coefficients.csv", coeff_mtime)
+    baseline = load_csv_or_none("score2_baseline.csv", base_mtime)
+    if coeffs is not None and baseline is not None:
+        bundles = _build_score2_bundles(coeffs, baseline)
+    else:
+        # Mangler en af CSV'erne, bruges de indbyggede bundter for begge køn.
+        bundles = _BUILTIN_BUNDLES
+    # Koefficienterne som NumPy-vektor i kanonisk term-rækkefølge (bundle-felterne),
+    # så den vektoriserede sti kan beregne lp som ét dot-produkt coefs @ feats.
+    coef_vecs = {
+        sex: np.array([getattr(b, f) for f in CoeffBundle._fields[:9]])
+        for sex, b in bundles.items()
+    }
+    return bundles, coef_vecs
+
+# Mtimes genberegnes på hvert rerun; de indgår både i tabel-nøglen her og i
+# calculate_score2's cache-nøgle, så gamle memo-entries ikke overlever en
+# opdateret koefficient-CSV på disk.
+_SCORE2_COEFF_MTIME = _csv_mtime("score2_coefficients.csv")
+_SCORE2_BASE_MTIME = _csv_mtime("score2_baseline.csv")
+
+SCORE2_BUNDLES, SCORE2_COEF_VECS = _score2_tables(_SCORE2_COEFF_MTIME, _SCORE2_BASE_MTIME)
+
+# log(-log(s0)) per køn beregnet én gang; bruges af den fusionerede kalibrering.
+SCORE2_LN_NEGLN_S0 = {sex: math.log(-math.log(b.s0)) for sex, b in SCORE2_BUNDLES.items()}
+
+def calculate_score2_vec(age: int, sex_label: str, sbp, tc, hdl, smoker_label: str) -> Optional[np.ndarray]:
+    """Vektoriseret SCORE2: sbp/tc/hdl kan være skalarer eller arrays (broadcastes).
+
+    Gør fx en risiko-vs-SBP-kurve til én NumPy-evaluering i stedet for
+    N Python-kald. Returnerer kalibrerede procenter som np.ndarray.
+    """
+    sex_code = _SEX_MAP.get(sex_label, "F")
+    b = SCORE2_BUNDLES.get(sex_code)
+    if b is None:
         return None
 
+    sbp, tc, hdl = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(sbp, dtype=float)),
+        np.atleast_1d(np.asarray(tc, dtype=float)),
+        np.atleast_1d(np.asarray(hdl, dtype=float)),
+    )
     cage = (age - 60) / 5.0
-    csbp = (sbp - 120) / 20.0
+    csbp = (sbp - 120.0) / 20.0
     ctc = (tc - 6.0) / 1.0
     chdl = (hdl - 1.3) / 0.5
-    csmoke = 1.0 if smoker_label == "Ja" else 0.0
-
-    lp = 0.0
-    for _, row in df.iterrows():
-        term = str(row["term"]).lower()
-        coef = float(row["coef"])
-        if term == "cage":
-            lp += coef * cage
-        elif term == "csbp":
-            lp += coef * csbp
-        elif term in ("ctc","ctchol"):
-            lp += coef * ctc
-        elif term == "chdl":
-            lp += coef * chdl
-        elif term in ("smoke","current_smoker"):
-            lp += coef * csmoke
-        elif term in ("cage*csbp","cage_csbp"):
-            lp += coef * cage * csbp
-        elif term in ("cage*ctc","cage_ctchol"):
-            lp += coef * cage * ctc
-        elif term in ("cage*chdl","cage_chdl"):
-            lp += coef * cage * chdl
-        elif term in ("cage*smoke","cage_smoker"):
-            lp += coef * cage * csmoke
-
-    base = baseline_df[
-        (baseline_df["sex"].str.upper().str[0] == sex_code) &
-        (baseline_df["region"].str.lower().isin(["northerneurope","low","low-risk","nordeuropa"]))
-    ]
-    if base.empty:
-        base = baseline_df[baseline_df["sex"].str.upper().str[0] == sex_code]
-    if base.empty:
+    csmoke = _SMOKER_MAP.get(smoker_label, 0.0)
+
+    # Featurematrix (N, 9) i kanonisk rækkefølge; kernen beregner lp og den
+    # fusionerede kalibrering i ét gennemløb (JIT'et hvis numba findes).
+    ones = np.ones_like(csbp)
+    feats_t = np.stack([
+        cage * ones, csbp, ctc, chdl, csmoke * ones,
+        cage * csbp, cage * ctc, cage * chdl, (cage * csmoke) * ones,
+    ], axis=1)
+    return _score2_batch_kernel(
+        SCORE2_COEF_VECS[sex_code], feats_t,
+        SCORE2_LN_NEGLN_S0[sex_code], b.scale1, b.scale2,
+    )
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _calculate_score2_cached(
+    age: int, sex_label: str, sbp: float, tc: float, hdl: float, smoker_label: str,
+    coeff_mtime: float, base_mtime: float,
+) -> Optional[float]:
+    # coeff_mtime/base_mtime bruges ikke i beregningen, men binder cache-nøglen
+    # til tabel-versionen fra _score2_tables: ændres CSV'erne, invalideres
+    # tidligere sete argument-tupler i stedet for at servere gamle risici.
+    sex_code = _SEX_MAP.get(sex_label, "F")
+    b = SCORE2_BUNDLES.get(sex_code)
+    if b is None:
         return None
+    return float(_score2_scalar_kernel(
+        (age - 60) / 5.0,
+        (sbp - 120.0) / 20.0,
+        (tc - 6.0) / 1.0,
+        (hdl - 1.3) / 0.5,
+        _SMOKER_MAP.get(smoker_label, 0.0),
+        b.cage, b.csbp, b.ctc, b.chdl, b.smoke,
+        b.cage_csbp, b.cage_ctc, b.cage_chdl, b.cage_smoke,
+        SCORE2_LN_NEGLN_S0[sex_code], b.scale1, b.scale2,
+    ))
 
-    s0 = float(base.iloc[0]["s0_10y"])
-    scale1 = float(base.iloc[0]["scale1"])
-    scale2 = float(base.iloc[0]["scale2"])
+def calculate_score2(age: int, sex_label: str, sbp: float, tc: float, hdl: float, smoker_label: str) -> Optional[float]:
+    return _calculate_score2_cached(
+        age, sex_label, sbp, tc, hdl, smoker_label,
+        _SCORE2_COEFF_MTIME, _SCORE2_BASE_MTIME,
+    )
 
-    try:
-        risk_uncal = 1.0 - math.exp(math.log(s0) * math.exp(lp))
-        risk_uncal = clamp(risk_uncal, 1e-9, 0.999999)
-        ln_negln = math.log(-math.log(1.0 - risk_uncal))
-        risk_cal = 1.0 - math.exp(-math.exp(scale1 + scale2 * ln_negln))
-        return float(100.0 * clamp(risk_cal, 0.0, 0.9999))
-    except Exception:
-        return None
+# Kategorigrænser per 10-års aldersbånd fra 40; <40 bruger laveste bånd.
+_RISK_CUTS = ((2.5, 7.5), (5.0, 10.0), (7.5, 15.0), (10.0, 20.0))
+_RISK_LABELS = (("Lav risiko", "green"), ("Moderat risiko", "orange"), ("Høj/Meget høj risiko", "red"))
+_RISK_EMOJI = {"green": "🟢", "orange": "🟠", "red": "🔴", "gray": "⚪"}
 
 def risk_category(score2_pct: Optional[float], age: int) -> Tuple[str, str]:
     if score2_pct is None:
         return "Ukendt", "gray"
-    r = score2_pct
-    if 40 <= age <= 49:
-        cuts = (2.5, 7.5)
-    elif 50 <= age <= 59:
-        cuts = (5.0, 10.0)
-    elif 60 <= age <= 69:
-        cuts = (7.5, 15.0)
-    else:
-        cuts = (10.0, 20.0)
-    low, high = cuts
-    if r < low:
-        return "Lav risiko", "green"
-    elif r < high:
-        return "Moderat risiko", "orange"
-    else:
-        return "Høj/Meget høj risiko", "red"
+    low, high = _RISK_CUTS[max(0, min(3, (age - 40) // 10))]
+    # Grenløst opslag: 0/1/2 afhængigt af hvor mange grænser risikoen passerer
+    return _RISK_LABELS[(score2_pct >= low) + (score2_pct >= high)]
 
 # =========================
 # INTERAKTIONER (andre præparater)
@@ -194,6 +324,36 @@ INTERACTION_DEFS = {
     "Prednisolon (høj dosis)": {"caution": ["Diuretika"], "why": "Væskeretention; kan modvirke antihypertensiv effekt."},
 }
 
+# Hvert præparat får en bit, og de afkrydsede præparater samles til én int-maske;
+# interaktionstjekket i build_recommendation er så rene bit-AND-operationer.
+class Drug(IntFlag):
+    LITHIUM = 1
+    NSAID = 2
+    VERAPAMIL_DILTIAZEM = 4
+    K_SUPPLEMENT = 8
+    PREDNISOLON = 16
+
+# UI-label → bitflag (rækkefølgen i INTERACTION_DEFS matcher Drug-definitionen)
+_DRUG_FLAGS: Dict[str, Drug] = dict(zip(INTERACTION_DEFS, Drug))
+
+# Afledt af INTERACTION_DEFS én gang ved import: flade records med
+# færdigformaterede beskeder, så interaktionsloopet i build_recommendation er
+# ét lineært gennemløb af 5 tupler uden dict-opslag eller join.
+def _build_flat_interactions() -> Tuple[Tuple[Drug, Tuple[Dict[str, str], ...], Optional[Dict[str, str]]], ...]:
+    records = []
+    for drug, entry in INTERACTION_DEFS.items():
+        why = entry.get("why", "")
+        msgs = []
+        if "avoid" in entry:
+            msgs.append({"text": f"Interaktion ({drug}): undgå {', '.join(entry['avoid'])}.", "why": why})
+        if "caution" in entry:
+            msgs.append({"text": f"Interaktion ({drug}): forsigtighed med {', '.join(entry['caution'])}.", "why": why})
+        rationale = {"text": f"Interaktion ({drug}): {why}"} if why else None
+        records.append((_DRUG_FLAGS[drug], tuple(msgs), rationale))
+    return tuple(records)
+
+_INTERACTIONS = _build_flat_interactions()
+
 # =========================
 # UI: Patientoplysninger
 # =========================
@@ -202,85 +362,135 @@ st.caption("Prototype til undervisning. Verificér altid mod gældende danske re
 st.markdown("---")
 
 example = None
-if "examples" in st.session_state and st.session_state["examples"]:
-    names = [r.get("navn","Case") for r in st.session_state["examples"]]
+df_ex = st.session_state.get("examples_df")
+if df_ex is not None and not df_ex.empty:
+    names = df_ex["navn"].tolist() if "navn" in df_ex.columns else [f"Case {i+1}" for i in range(len(df_ex))]
     choice = st.sidebar.selectbox("Vælg eksempel", ["(Ingen)"] + names)
     if choice != "(Ingen)":
-        example = next(r for r in st.session_state["examples"] if r.get("navn","Case")==choice)
-
-st.header("1) Patientoplysninger")
-colA, colB, colC = st.columns(3)
-with colA:
-    alder = st.number_input("Alder (år)", 18, 95, int(example["alder"]) if example else 58)
-    koen = st.selectbox("Køn", ["Mand","Kvinde"], index=(0 if not example else (0 if example.get("køn","Mand")=="Mand" else 1)))
-    ryger = st.selectbox("Ryger", ["Nej","Ja"], index=(1 if (example and example.get("ryger","Nej")=="Ja") else 0))
-with colB:
-    sbp = st.number_input("Systolisk BT (mmHg)", 80, 250, int(example["sbp"]) if example else 150)
-    tc = st.number_input("Total-kolesterol (mmol/L)", 2.0, 12.0, float(example["tchol"]) if example else 5.8, step=0.1, format="%.1f")
-with colC:
-    hdl = st.number_input("HDL (mmol/L)", 0.5, 4.0, float(example["hdl"]) if example else 1.3, step=0.1, format="%.1f")
-    st.write("**Komorbiditeter/forhold**")
-    diabetes = st.checkbox("Diabetes", value=(example.get("diabetes","Nej")=="Ja") if example else False)
-    ckd = st.checkbox("CKD/kronisk nyresygdom", value=(example.get("ckd","Nej")=="Ja") if example else False)
-    proteinuria = st.checkbox("Betydende albuminuri/proteinuri", value=(example.get("proteinuri","Nej")=="Ja") if example else False)
-    cad = st.checkbox("Iskæmisk hjertesygdom", value=(example.get("cad","Nej")=="Ja") if example else False)
-    heart_failure = st.checkbox("Hjertesvigt", value=(example.get("hf","Nej")=="Ja") if example else False)
-    af = st.checkbox("Atrieflimren", value=(example.get("af","Nej")=="Ja") if example else False)
-    stroke_tia = st.checkbox("Apopleksi/TIA", value=(example.get("stroke_tia","Nej")=="Ja") if example else False)
-    pregnancy = st.checkbox("Graviditet", value=False)
-    gout = st.checkbox("Urin-syregigt", value=(example.get("gigt","Nej")=="Ja") if example else False)
-    asthma_copd = st.checkbox("Astma/COPD", value=(example.get("astma_copd","Nej")=="Ja") if example else False)
-    edema = st.checkbox("Tendens til perifere ødemer", value=(example.get("ødem","Nej")=="Ja") if example else False)
+        # Kun den valgte række materialiseres som dict
+        example = df_ex.iloc[names.index(choice)].to_dict()
+
+# Komorbiditets-checkboxes drives af én tabel: (nøgle, eksempel-kolonne, label).
+# Graviditet har ingen eksempel-kolonne og starter altid uafkrydset.
+COMORBIDS = (
+    ("diabetes", "diabetes", "Diabetes"),
+    ("ckd", "ckd", "CKD/kronisk nyresygdom"),
+    ("proteinuria", "proteinuri", "Betydende albuminuri/proteinuri"),
+    ("cad", "cad", "Iskæmisk hjertesygdom"),
+    ("heart_failure", "hf", "Hjertesvigt"),
+    ("af", "af", "Atrieflimren"),
+    ("stroke_tia", "stroke_tia", "Apopleksi/TIA"),
+    ("pregnancy", None, "Graviditet"),
+    ("gout", "gigt", "Urin-syregigt"),
+    ("asthma_copd", "astma_copd", "Astma/COPD"),
+    ("edema", "ødem", "Tendens til perifere ødemer"),
+)
 
-# =========================
-# Labs
-# =========================
-st.header("2) Væsketal/elektrolytter")
-refs = age_adjusted_refs(int(alder))
-c1, c2, c3, c4 = st.columns(4)
-with c1:
-    na = st.number_input(f"Na⁺ (mmol/L) — ref {refs['na'][0]:.1f}–{refs['na'][1]:.1f}", 110.0, 170.0, float(example.get("na",138)) if example else 138.0, step=0.1)
-with c2:
-    k = st.number_input(f"K⁺ (mmol/L) — ref {refs['k'][0]:.1f}–{refs['k'][1]:.1f}", 2.0, 7.0, float(example.get("k",4.2)) if example else 4.2, step=0.1)
-with c3:
-    egfr = st.number_input(f"eGFR (mL/min/1.73m²) — ref {refs['egfr'][0]:.0f}–{refs['egfr'][1]:.0f}", 5.0, 200.0, float(example.get("egfr",85)) if example else 85.0, step=1.0)
-with c4:
-    urate = st.number_input(f"Urat (mmol/L) — ref {refs['urate'][0]:.2f}–{refs['urate'][1]:.2f}", 0.05, 2.0, float(example.get("urat",0.35)) if example else 0.35, step=0.01)
-
-alerts = []
-if outside(refs["na"], na):
-    alerts.append("Na⁺ uden for reference — undgå tiazider ved hyponatriæmi.")
-if outside(refs["k"], k):
-    alerts.append("K⁺ uden for reference — RAAS/MRA kan give hyperkaliæmi.")
-if egfr < refs["egfr"][0]:
-    alerts.append("eGFR under reference — tiazider mindre effektive ved eGFR <30; forsigtighed med MRA.")
-if outside(refs["urate"], urate):
-    alerts.append("Urat forhøjet — tiazider kan forværre urinsyregigt.")
+def _normalize_example(example: Optional[Dict]) -> Dict:
+    """Normaliserer en valgt eksempelrække til præ-castede widget-defaults.
+
+    Alle get/cast/sammenligninger sker én gang her i stedet for spredt ud
+    over ~15 ternaries i widget-blokken.
+    """
+    ex = example or {}
+    return {
+        "alder": int(ex.get("alder", 58)),
+        "koen_idx": 0 if ex.get("køn", "Mand") == "Mand" else 1,
+        "ryger_idx": 1 if ex.get("ryger", "Nej") == "Ja" else 0,
+        "sbp": int(ex.get("sbp", 150)),
+        "tc": float(ex.get("tchol", 5.8)),
+        "hdl": float(ex.get("hdl", 1.3)),
+        "na": float(ex.get("na", 138.0)),
+        "k": float(ex.get("k", 4.2)),
+        "egfr": float(ex.get("egfr", 85.0)),
+        "urate": float(ex.get("urat", 0.35)),
+        "comorbid": {key: (ex.get(exk, "Nej") == "Ja") if exk else False for key, exk, _ in COMORBIDS},
+    }
+
+# Alle input samles i én form, så redigering ikke udløser reruns;
+# hele skemaet committes i ét rerun ved tryk på knappen.
+with st.form("patient_form"):
+    defaults = _normalize_example(example)
+    st.header("1) Patientoplysninger")
+    # Widget-returtyper: number_input med int-grænser (alder, sbp) returnerer
+    # int; med float-grænser/step (tc, hdl, labs) returnerer float. Værdierne
+    # bruges derfor nedenfor uden ekstra int()/float()-kast.
+    colA, colB, colC = st.columns(3)
+    with colA:
+        alder = st.number_input("Alder (år)", 18, 95, defaults["alder"])
+        koen = st.selectbox("Køn", ["Mand","Kvinde"], index=defaults["koen_idx"])
+        ryger = st.selectbox("Ryger", ["Nej","Ja"], index=defaults["ryger_idx"])
+    with colB:
+        sbp = st.number_input("Systolisk BT (mmHg)", 80, 250, defaults["sbp"])
+        tc = st.number_input("Total-kolesterol (mmol/L)", 2.0, 12.0, defaults["tc"], step=0.1, format="%.1f")
+    with colC:
+        hdl = st.number_input("HDL (mmol/L)", 0.5, 4.0, defaults["hdl"], step=0.1, format="%.1f")
+        st.write("**Komorbiditeter/forhold**")
+        comorbid = {
+            key: st.checkbox(label, value=defaults["comorbid"][key])
+            for key, _exk, label in COMORBIDS
+        }
+
+    # =========================
+    # Labs
+    # =========================
+    st.header("2) Væsketal/elektrolytter")
+    refs = age_adjusted_refs(alder)
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        na = st.number_input(f"Na⁺ (mmol/L) — ref {refs['na'][0]:.1f}–{refs['na'][1]:.1f}", 110.0, 170.0, defaults["na"], step=0.1)
+    with c2:
+        k = st.number_input(f"K⁺ (mmol/L) — ref {refs['k'][0]:.1f}–{refs['k'][1]:.1f}", 2.0, 7.0, defaults["k"], step=0.1)
+    with c3:
+        egfr = st.number_input(f"eGFR (mL/min/1.73m²) — ref {refs['egfr'][0]:.0f}–{refs['egfr'][1]:.0f}", 5.0, 200.0, defaults["egfr"], step=1.0)
+    with c4:
+        urate = st.number_input(f"Urat (mmol/L) — ref {refs['urate'][0]:.2f}–{refs['urate'][1]:.2f}", 0.05, 2.0, defaults["urate"], step=0.01)
+
+    # =========================
+    # Interaktioner (andre præparater)
+    # =========================
+    st.header("3) Andre samtidige præparater — interaktionstjek")
+    st.caption("Marker hvis patienten får følgende (kan påvirke valg af BT-behandling).")
+    interaction_mask = 0
+    for drug, col in zip(INTERACTION_DEFS, itertools.cycle(st.columns(3))):
+        if col.checkbox(drug, value=False):
+            interaction_mask |= _DRUG_FLAGS[drug]
+
+    submitted = st.form_submit_button("Opdatér beslutningsstøtte")
+
+# Lab-alarmer som én vektoriseret range-test: værdier og grænser pakkes i
+# arrays, og beskederne slås op i den statiske tupel via masken. Nye labs
+# tilføjes ved blot at udvide tabellerne.
+lab_vals = np.array([na, k, egfr, urate])
+lab_lows = np.array([refs[key][0] for key in _LAB_KEYS])
+# eGFR har kun en klinisk relevant nedre grænse her; øvre sættes til inf
+lab_highs = np.array([refs["na"][1], refs["k"][1], np.inf, refs["urate"][1]])
+lab_mask = (lab_vals < lab_lows) | (lab_vals > lab_highs)
+alerts = [_LAB_MSGS[i] for i in np.flatnonzero(lab_mask)]
 if alerts:
     st.warning("**Elektrolyt/nyrefunktion — opmærksomhedspunkter:**\n\n- " + "\n- ".join(alerts))
 
 # =========================
 # SCORE2
 # =========================
-st.header("3) SCORE2 (10-års risiko)")
+st.header("4) SCORE2 (10-års risiko)")
 colL, colR = st.columns([2,1])
 with colL:
     st.caption("Beregnes automatisk ud fra CSV; fallback indbygget.")
 with colR:
     manual_score2 = st.number_input("Manuel SCORE2 % (fallback)", 0.0, 100.0, 7.0, step=0.1)
 
-auto_score2 = calculate_score2(int(alder), koen, float(sbp), float(tc), float(hdl), ryger)
+auto_score2 = calculate_score2(alder, koen, sbp, tc, hdl, ryger)
 score2_final = auto_score2 if auto_score2 is not None else manual_score2
-cat, color = risk_category(score2_final, int(alder))
+cat, color = risk_category(score2_final, alder)
 rc1, rc2 = st.columns([1,3])
 with rc1:
     st.metric("SCORE2", f"{score2_final:.1f}%")
 with rc2:
-    ridx = {"green":"🟢","orange":"🟠","red":"🔴","gray":"⚪"}.get(color,"🟢")
-    st.markdown(f"### {ridx} {cat}")
+    st.markdown(f"### {_RISK_EMOJI.get(color, '🟢')} {cat}")
 
 # Visuel risikoskala (HTML)
-marker = max(0.0, min(100.0, float(score2_final)))
+marker = max(0.0, min(100.0, score2_final))
 risk_html = f"""
 <div style="margin-top:6px;">
   <div style="height:14px; background: linear-gradient(90deg,#2ecc71,#f1c40f,#e67e22,#e74c3c); border-radius:7px; position:relative;">
@@ -294,24 +504,13 @@ risk_html = f"""
 """
 st.markdown(risk_html, unsafe_allow_html=True)
 
-if diabetes:
+if comorbid["diabetes"]:
     st.warning(
         "**Bemærk: SCORE2 er ikke tiltænkt personer med diabetes.**\n\n"
         "- Diabetes indebærer høj/meget høj kardiovaskulær risiko, som SCORE2 ikke afspejler korrekt.\n"
         "- Brug diabetes-specifik vurdering og følg højrisko-behandlingsmål."
     )
 
-# =========================
-# Interaktioner (andre præparater)
-# =========================
-st.header("4) Andre samtidige præparater — interaktionstjek")
-st.caption("Marker hvis patienten får følgende (kan påvirke valg af BT-behandling).")
-icol1, icol2, icol3 = st.columns(3)
-interaction_state: Dict[str, bool] = {}
-for i, drug in enumerate(INTERACTION_DEFS.keys()):
-    with [icol1, icol2, icol3][i % 3]:
-        interaction_state[drug] = st.checkbox(drug, value=False)
-
 # =========================
 # Indikation for behandling & forslag (konservativ vs farmakologisk)
 # =========================
@@ -358,37 +557,65 @@ def egfr_low(egfr_val: float) -> bool:
 def gout_risk(urate_val: float, gout_flag: bool) -> bool:
     return gout_flag or (urate_val is not None and urate_val > 0.42)
 
-def sbp_grade(sbp_val: float) -> str:
-    if sbp_val >= 180:
-        return "Grad 3"
-    elif sbp_val >= 160:
-        return "Grad 2"
-    elif sbp_val >= 140:
-        return "Grad 1"
-    elif sbp_val >= 130:
-        return "Højt-normal"
-    else:
-        return "Normal"
+# BT-grad som heltal: regel-logikken sammenligner ints, og strengen slås
+# først op i GRADE_LABEL ved visning.
+class SbpGrade(IntEnum):
+    NORMAL = 0
+    HIGH_NORMAL = 1
+    G1 = 2
+    G2 = 3
+    G3 = 4
+
+GRADE_LABEL = ("Normal", "Højt-normal", "Grad 1", "Grad 2", "Grad 3")
+
+def sbp_grade(sbp_val: float) -> SbpGrade:
+    # Grenløst: antal passerede grænser giver direkte enum-værdien
+    return SbpGrade((sbp_val >= 130) + (sbp_val >= 140) + (sbp_val >= 160) + (sbp_val >= 180))
 
 def indication_for_treatment(sbp_val: float, score2_pct: float, high_risk_flags: bool) -> Tuple[str, str]:
     """
     Returnerer ('Conservative'/'Pharmacologic', begrundelse)
     """
     grade = sbp_grade(sbp_val)
-    if grade in ("Grad 2", "Grad 3"):
-        return "Pharmacologic", f"{grade}: behandlingsindikation."
-    if grade == "Grad 1":
+    if grade >= SbpGrade.G2:
+        return "Pharmacologic", f"{GRADE_LABEL[grade]}: behandlingsindikation."
+    if grade == SbpGrade.G1:
         if high_risk_flags or score2_pct >= 7.5:
             return "Pharmacologic", "Grad 1 + forhøjet risiko/komorbiditet: behandlingsindikation."
         else:
             return "Conservative", "Grad 1 uden højrisiko: start livsstilsintervention og tæt kontrol."
-    if grade == "Højt-normal":
+    if grade == SbpGrade.HIGH_NORMAL:
         if high_risk_flags or score2_pct >= 10.0:
             return "Pharmacologic", "Højt-normal + høj risiko/komorbiditet: kan overveje farmakologisk."
         else:
             return "Conservative", "Højt-normal: livsstilsintervention og revurdering."
     return "Conservative", "Normalt BT: livsstilsråd og observation."
 
+# Deklarative kontraindikationsbeskeder i samme rækkefølge som gate-tuplen i
+# build_recommendation; delte dict-konstanter, ingen allokering per kald.
+_CONTRA_MSGS = (
+    {"text": "Hyperkaliæmi: undgå ACE/ARB/MRA indtil korrigeret.", "why": "Risiko for alvorlig K⁺-stigning."},
+    {"text": "Hyponatriæmi: undgå tiazid-lignende diuretika.", "why": "Forværrer Na⁺-tab."},
+    {"text": "eGFR <30: tiazid-lignende ineffektiv; MRA med forsigtighed.", "why": "Nedsat effekt/radikseret udskillelse."},
+    {"text": "Urinsyregigt/forhøjet urat: undgå tiazid-lignende.", "why": "Øger urinsyre."},
+    {"text": "Graviditet: undgå ACE/ARB/MRA.", "why": "Føtotoksisk risiko."},
+)
+
+# Konservative råd som delt, immutabel tupel: builderen genallokerer ikke
+# seks strenge/dicts per kald, kun en list() over samme dict-referencer.
+CONSERVATIVE_ADVICE = tuple({"text": t} for t in (
+    "Saltreduktion (<5–6 g/dag) og grønt/fisk-rig kost.",
+    "Vægttab ved BMI>25 (mål 5–10%).",
+    "Alkoholreduktion (max 7/14 genstande pr. uge Kv/M).",
+    "Motion ≥150 min/uge (moderat) + styrke 2×/uge.",
+    "Rygestop og stress-/søvnoptimering.",
+    "Hjemme-BT og revurdering om 3–6 mdr.",
+))
+
+# Ren funktion af skalarer + interaktionsmasken (hashable int), så gentagne
+# parameterkombinationer (fx en checkbox der togglies frem og tilbage) rammer
+# cachen i stedet for at genkøre hele regel-kaskaden.
+@st.cache_data(max_entries=256, show_spinner=False)
 def build_recommendation(
     sbp_val: float,
     diabetes_flag: bool,
@@ -403,64 +630,50 @@ def build_recommendation(
     gout_flag: bool,
     na_val: float, k_val: float, egfr_val: float, urate_val: float,
     score2_pct: float,
-    interactions_checked: Dict[str, bool],
+    interactions_checked: int,
 ) -> Dict[str, List[Dict[str, str]]]:
     out = {"conservative": [], "firstline": [], "avoid": [], "rationale": [], "planb": [], "flow": []}
     grade = sbp_grade(sbp_val)
     high_risk_flags = any([diabetes_flag, ckd_flag, proteinuria_flag, heart_failure_flag, cad_flag, af_flag])
+
+    # Gate-værdier beregnes én gang som bools; resten af regelkaskaden er
+    # derefter ren boolesk algebra uden gentagne lab-tjek eller closures.
+    hyper_k = has_hyperkalemia(k_val)
+    hypo_na = has_hyponatremia(na_val)
+    low_egfr = egfr_low(egfr_val)
+    gouty = gout_risk(urate_val, gout_flag)
+    raas_ok = not (hyper_k or pregnancy_flag)
+    thiazide_ok = not (hypo_na or low_egfr or gouty)
+    ccb_ok = True
+
     mode, why = indication_for_treatment(sbp_val, score2_pct, high_risk_flags)
-    out["rationale"].append({"text": f"BT-grad: **{grade}**. {why}"})
+    out["rationale"].append({"text": f"BT-grad: **{GRADE_LABEL[grade]}**. {why}"})
 
-    # FLOW-diagram (trin)
+    # FLOW-diagram (trin) — grænserne udtrykkes via grade, ikke rå SBP-sammenligninger
+    need_combo = grade >= SbpGrade.G2 or (
+        grade >= SbpGrade.G1 and (diabetes_flag or ckd_flag or proteinuria_flag or score2_pct >= 10.0)
+    )
     out["flow"].append("Konservativ")
     if mode == "Pharmacologic":
-        if sbp_val >= 160 or (sbp_val >= 140 and (diabetes_flag or ckd_flag or proteinuria_flag or score2_pct >= 10.0)):
-            out["flow"].append("Kombination")
-        else:
-            out["flow"].append("Monoterapi")
-        if sbp_val >= 160:
+        out["flow"].append("Kombination" if need_combo else "Monoterapi")
+        if grade >= SbpGrade.G2:
             out["flow"].append("+ MRA ved resistens")
 
-    # Interaktioner
-    for drug, on in interactions_checked.items():
-        if not on:
+    # Interaktioner: bitmaske-tjek mod flade, præformaterede records
+    for flag, msgs, rationale in _INTERACTIONS:
+        if not interactions_checked & flag:
             continue
-        entry = INTERACTION_DEFS.get(drug, {})
-        if "avoid" in entry:
-            out["avoid"].append({"text": f"Interaktion ({drug}): undgå {', '.join(entry['avoid'])}.", "why": entry.get("why","")})
-        if "caution" in entry:
-            out["avoid"].append({"text": f"Interaktion ({drug}): forsigtighed med {', '.join(entry['caution'])}.", "why": entry.get("why","")})
-        if entry.get("why"):
-            out["rationale"].append({"text": f"Interaktion ({drug}): {entry['why']}"})
-
-    # Labs/kliniske flags -> kontraindikationer
-    if has_hyperkalemia(k_val):
-        out["avoid"].append({"text": "Hyperkaliæmi: undgå ACE/ARB/MRA indtil korrigeret.", "why": "Risiko for alvorlig K⁺-stigning."})
-    if has_hyponatremia(na_val):
-        out["avoid"].append({"text": "Hyponatriæmi: undgå tiazid-lignende diuretika.", "why": "Forværrer Na⁺-tab."})
-    if egfr_low(egfr_val):
-        out["avoid"].append({"text": "eGFR <30: tiazid-lignende ineffektiv; MRA med forsigtighed.", "why": "Nedsat effekt/radikseret udskillelse."})
-    if gout_risk(urate_val, gout_flag):
-        out["avoid"].append({"text": "Urinsyregigt/forhøjet urat: undgå tiazid-lignende.", "why": "Øger urinsyre."})
-    if pregnancy_flag:
-        out["avoid"].append({"text": "Graviditet: undgå ACE/ARB/MRA.", "why": "Føtotoksisk risiko."})
-
-    # Konservative råd (vises altid)
-    conservative_list = [
-        "Saltreduktion (<5–6 g/dag) og grønt/fisk-rig kost.",
-        "Vægttab ved BMI>25 (mål 5–10%).",
-        "Alkoholreduktion (max 7/14 genstande pr. uge Kv/M).",
-        "Motion ≥150 min/uge (moderat) + styrke 2×/uge.",
-        "Rygestop og stress-/søvnoptimering.",
-        "Hjemme-BT og revurdering om 3–6 mdr.",
-    ]
-    for t in conservative_list:
-        out["conservative"].append({"text": t})
-
-    # Tilladt-valg helpers
-    def allowed_raas():   return not (has_hyperkalemia(k_val) or pregnancy_flag)
-    def allowed_thiaz():  return not (has_hyponatremia(na_val) or egfr_low(egfr_val) or gout_risk(urate_val, gout_flag))
-    def allowed_ccb():    return True
+        out["avoid"].extend(msgs)
+        if rationale is not None:
+            out["rationale"].append(rationale)
+
+    # Labs/kliniske flags -> kontraindikationer: gates zippes mod regel-tabellen
+    for on, msg in zip((hyper_k, hypo_na, low_egfr, gouty, pregnancy_flag), _CONTRA_MSGS):
+        if on:
+            out["avoid"].append(msg)
+
+    # Konservative råd (vises altid; delt modul-tupel, se CONSERVATIVE_ADVICE)
+    out["conservative"] = list(CONSERVATIVE_ADVICE)
 
     # Basis-rationale
     if ckd_flag or proteinuria_flag or diabetes_flag:
@@ -472,35 +685,33 @@ def build_recommendation(
 
     # Farmakologisk forslag
     if mode == "Pharmacologic":
-        need_combo = sbp_val >= 160 or (sbp_val >= 140 and (diabetes_flag or ckd_flag or proteinuria_flag or score2_pct >= 10.0))
-
         if pregnancy_flag:
             for d in DRUGS["PREG"]:
                 out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "Graviditet – undgå RAAS/MRA.", "reason": d["rationale"]})
         else:
             # RAAS basis hvis muligt
-            if allowed_raas():
+            if raas_ok:
                 for d in DRUGS["ACE"]:
                     out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "Basis.", "reason": d["rationale"]})
             else:
                 # RAAS kontraindiceret → CCB/Tiazid
-                if allowed_ccb():
+                if ccb_ok:
                     for d in DRUGS["CCB_DHP"]:
                         out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "RAAS kontraindiceret.", "reason": d["rationale"]})
-                if allowed_thiaz():
+                if thiazide_ok:
                     for d in DRUGS["THIAZIDE_LIKE"]:
                         out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "RAAS kontraindiceret.", "reason": d["rationale"]})
 
             if need_combo:
-                if allowed_ccb():
+                if ccb_ok:
                     for d in DRUGS["CCB_DHP"]:
                         out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "Kombinationsbehandling.", "reason": d["rationale"]})
-                if allowed_thiaz():
+                if thiazide_ok:
                     for d in DRUGS["THIAZIDE_LIKE"]:
                         out["firstline"].append({"name": d["name"], "dose": d["dose"], "note": "Kombinationsbehandling.", "reason": d["rationale"]})
 
             # Resistent – MRA
-            if sbp_val >= 160 and allowed_raas() and not has_hyperkalemia(k_val):
+            if grade >= SbpGrade.G2 and raas_ok:
                 for d in DRUGS["MRA"]:
                     out["planb"].append({"text": f"Overvej {d['name']} {d['dose']} (monitorér K⁺/kreatinin).", "why": d["rationale"]})
 
@@ -508,23 +719,23 @@ def build_recommendation(
 
 # ====== Kør anbefalingsmotor ======
 recommendation, mode, grade = build_recommendation(
-    sbp_val=float(sbp),
-    diabetes_flag=diabetes,
-    ckd_flag=ckd,
-    proteinuria_flag=proteinuria,
-    cad_flag=cad,
-    heart_failure_flag=heart_failure,
-    af_flag=af,
-    pregnancy_flag=pregnancy,
-    edema_flag=edema,
-    asthma_copd_flag=asthma_copd,
-    gout_flag=gout,
-    na_val=float(na),
-    k_val=float(k),
-    egfr_val=float(egfr),
-    urate_val=float(urate),
-    score2_pct=float(score2_final),
-    interactions_checked=interaction_state
+    sbp_val=sbp,
+    diabetes_flag=comorbid["diabetes"],
+    ckd_flag=comorbid["ckd"],
+    proteinuria_flag=comorbid["proteinuria"],
+    cad_flag=comorbid["cad"],
+    heart_failure_flag=comorbid["heart_failure"],
+    af_flag=comorbid["af"],
+    pregnancy_flag=comorbid["pregnancy"],
+    edema_flag=comorbid["edema"],
+    asthma_copd_flag=comorbid["asthma_copd"],
+    gout_flag=comorbid["gout"],
+    na_val=na,
+    k_val=k,
+    egfr_val=egfr,
+    urate_val=urate,
+    score2_pct=score2_final,
+    interactions_checked=int(interaction_mask)
 )
 
 # =========================
@@ -550,45 +761,48 @@ if recommendation["flow"]:
 
 # Headline anbefaling
 if mode == "Conservative":
-    st.success(f"**Hypertension-grad: {grade} — Konservativ behandling anbefales**")
+    st.success(f"**Hypertension-grad: {GRADE_LABEL[grade]} — Konservativ behandling anbefales**")
 else:
-    st.warning(f"**Hypertension-grad: {grade} — Farmakologisk behandling anbefales**")
+    st.warning(f"**Hypertension-grad: {GRADE_LABEL[grade]} — Farmakologisk behandling anbefales**")
 
-# Begrundelser (op under anbefaling)
+# Begrundelser (op under anbefaling) — én markdown-kald per liste i stedet
+# for ét st.write (og dermed ét delta/protobuf-rundtur) per punkt.
 st.subheader("Begrundelser (faglig resonnering)")
-for r in recommendation["rationale"]:
-    st.write(f"- {r['text']}")
+st.markdown("\n".join(f"- {r['text']}" for r in recommendation["rationale"]))
 
 # Førstevalg (lægemidler) med faglig note
 st.subheader("Førstevalg (stof + handelsnavn + startdosis)")
 if recommendation["firstline"]:
+    lines = []
     for d in recommendation["firstline"]:
         note = f" — {d['note']}" if d.get("note") else ""
         why = f"<div style='font-size:12px;color:#555;margin-left:10px;'>• {d.get('reason','')}</div>" if d.get("reason") else ""
-        st.markdown(f"- **{d['name']}** — {d['dose']}{note}{why}", unsafe_allow_html=True)
+        lines.append(f"- **{d['name']}** — {d['dose']}{note}{why}")
+    st.markdown("\n".join(lines), unsafe_allow_html=True)
 else:
     st.write("- (Ingen specifikke førstevalg – se konservativ behandling/plan nedenfor.)")
 
 # Konservativ behandling (vises altid)
 st.subheader("Konservativ behandling (livsstilsråd)")
-for r in recommendation["conservative"]:
-    st.write(f"- {r['text']}")
+st.markdown("\n".join(f"- {r['text']}" for r in recommendation["conservative"]))
 
 # Undgå/forsigtighed (med forklaring)
 st.subheader("Undgå / forsigtighed")
 if recommendation["avoid"]:
-    for a in recommendation["avoid"]:
-        why = f" ({a.get('why')})" if a.get("why") else ""
-        st.error(f"- {a['text']}{why}")
+    st.error("\n".join(
+        f"- {a['text']}" + (f" ({a.get('why')})" if a.get("why") else "")
+        for a in recommendation["avoid"]
+    ))
 else:
     st.write("- (Ingen specifikke)")
 
 # Plan B
 st.subheader("Plan B (hvis utilstrækkelig effekt/kontraindikation)")
 if recommendation["planb"]:
-    for p in recommendation["planb"]:
-        why = f" ({p.get('why')})" if p.get("why") else ""
-        st.warning(f"- {p['text']}{why}")
+    st.warning("\n".join(
+        f"- {p['text']}" + (f" ({p.get('why')})" if p.get("why") else "")
+        for p in recommendation["planb"]
+    ))
 else:
     st.write("- (Ingen)")
 
@@ -605,23 +819,40 @@ st.markdown(
 # =========================
 # SIMULER ÆNDRING
 # =========================
-st.header("6) Simulér ændring (SCORE2)")
-st.caption("Justér en parameter for at se forventet ændring i SCORE2 (anvender dine CSV-tal eller fallback).")
-simc = st.columns(3)
-with simc[0]:
-    sim_ryger = st.selectbox("Ryger (simuleret)", ["Nej","Ja"], index=(1 if ryger=="Ja" else 0))
-with simc[1]:
-    sim_tc = st.number_input("Total-kolesterol (simuleret)", 2.0, 12.0, max(2.0, float(tc)-0.8), step=0.1, format="%.1f")
-with simc[2]:
-    sim_sbp = st.number_input("SBP (simuleret)", 80.0, 250.0, max(80.0, float(sbp)-20), step=1.0, format="%.0f")
-
-sim_val = calculate_score2(int(alder), koen, float(sim_sbp), float(sim_tc), float(hdl), sim_ryger)
-delta_text = None
-if score2_final is not None and sim_val is not None:
-    d = sim_val - score2_final
-    arrow = "↘" if d < 0 else ("↗" if d > 0 else "→")
-    delta_text = f"{arrow} {d:+.1f} %-point"
-st.metric("SCORE2 efter simulering", f"{sim_val:.1f}%" if sim_val is not None else "—", delta=delta_text)
+# Simuleringspanelet kører som fragment: justering af de tre sim-widgets
+# genkører kun denne funktion, ikke hele scriptet (kræver Streamlit 1.37+).
+@st.fragment
+def _render_simulation(alder: int, koen: str, sbp, tc: float, hdl: float, ryger: str, score2_final) -> None:
+    st.header("6) Simulér ændring (SCORE2)")
+    st.caption("Justér en parameter for at se forventet ændring i SCORE2 (anvender dine CSV-tal eller fallback).")
+    simc = st.columns(3)
+    with simc[0]:
+        sim_ryger = st.selectbox("Ryger (simuleret)", ["Nej","Ja"], index=(1 if ryger=="Ja" else 0))
+    with simc[1]:
+        sim_tc = st.number_input("Total-kolesterol (simuleret)", 2.0, 12.0, max(2.0, tc - 0.8), step=0.1, format="%.1f")
+    with simc[2]:
+        sim_sbp = st.number_input("SBP (simuleret)", 80.0, 250.0, max(80.0, float(sbp)-20), step=1.0, format="%.0f")
+
+    sim_val = calculate_score2(alder, koen, sim_sbp, sim_tc, hdl, sim_ryger)
+    delta_text = None
+    if score2_final is not None and sim_val is not None:
+        d = sim_val - score2_final
+        arrow = "↘" if d < 0 else ("↗" if d > 0 else "→")
+        delta_text = f"{arrow} {d:+.1f} %-point"
+    st.metric("SCORE2 efter simulering", f"{sim_val:.1f}%" if sim_val is not None else "—", delta=delta_text)
+
+    # Sensitivitetskurve: hele SBP-intervallet beregnes i ét kald via den
+    # vektoriserede sti (ét dot-produkt) i stedet for et Python-kald per punkt.
+    sim_curve = calculate_score2_vec(alder, koen, np.arange(100.0, 201.0, 2.0), sim_tc, hdl, sim_ryger)
+    if sim_curve is not None:
+        import pandas as pd
+        st.line_chart(
+            pd.DataFrame({"SCORE2 (%)": sim_curve}, index=np.arange(100.0, 201.0, 2.0).astype(int)),
+            height=220,
+        )
+        st.caption("SCORE2 som funktion af SBP (100–200 mmHg) med de simulerede værdier for kolesterol og rygning.")
+
+_render_simulation(alder, koen, sbp, tc, hdl, ryger, score2_final)
 
 st.markdown("---")
 st.caption("Denne app er en undervisningsprototype og erstatter ikke klinisk vurdering. Kontroller altid mod gældende danske retningslinjer (cardio.dk / pro.medicin.dk / Lægehåndbogen).")
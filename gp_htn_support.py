@@ -17,12 +17,17 @@ Design notes:
 Author: Demo generated for teaching
 """
 
+import re
+import sys
 from dataclasses import dataclass
-from typing import Optional, List, Dict
+from functools import lru_cache
+from typing import Optional, List, Dict, Tuple
+
+import numpy as np
 
 # ------------------ Data structures ------------------
 
-@dataclass
+@dataclass(slots=True)
 class Patient:
     age: int
     sex: str  # 'F' or 'M' (not used by rules below but kept for future use)
@@ -50,35 +55,421 @@ class Patient:
     peripheral_edema_tendency: bool = False
     proteinuria: bool = False  # significant albuminuria/proteinuria
 
+    @property
+    def flags(self) -> int:
+        """Komorbiditets-bools pakket til ét F-bitmask (se _FLAG_ATTRS)."""
+        bits = 0
+        for attr, bit in _FLAG_ATTRS:
+            if getattr(self, attr):
+                bits |= bit
+        return bits
+
 # ------------------ SCORE2 handling ------------------
 
-def intervention_threshold(age: int) -> float:
-    if 40 <= age <= 59:
-        return 5.0
-    if 60 <= age <= 69:
-        return 7.5
-    if 70 <= age <= 75:
-        return 10.0
-    # Outside validated SCORE2 range for this threshold scheme
-    return float('nan')
+# Aldersbånd → tærskel som opslagstabel: ét indekseret load i stedet for tre
+# grene, og batch-stien bliver ét fancy-index. NaN uden for valideret 40-75.
+_TH_TABLE = np.full(120, np.nan, dtype=np.float32)
+_TH_TABLE[40:60] = 5.0
+_TH_TABLE[60:70] = 7.5
+_TH_TABLE[70:76] = 10.0
+
+def intervention_threshold(age: int) -> Optional[float]:
+    th = _TH_TABLE[age] if 0 <= age < _TH_TABLE.shape[0] else np.nan
+    # Outside validated SCORE2 range for this threshold scheme -> None
+    return float(th) if th == th else None
+
+# Tærsklerne er tre faste værdier — formatér dem én gang ved import
+_TH_STR = {None: None, 5.0: "5.0%", 7.5: "7.5%", 10.0: "10.0%"}
 
 def score2_intervention_flag(p: Patient) -> Dict[str, Optional[str]]:
     th = intervention_threshold(p.age)
-    if p.score2_pct is None or not (40 <= p.age <= 75):
+    if p.score2_pct is None or th is None:
         return {
-            "threshold": None if th != th else f"{th:.1f}%",
+            "threshold": _TH_STR[th],
             "intervention_recommended": None,
             "note": "Enter SCORE2 from DSAM/ESC chart to assess threshold crossing (valid ages 40–75)."
         }
     flag = p.score2_pct >= th
     return {
-        "threshold": f"{th:.1f}%",
+        "threshold": _TH_STR[th],
         "intervention_recommended": "Yes" if flag else "No",
         "note": "Threshold per DSAM: 40–59 ≥5%, 60–69 ≥7.5%, 70–75 ≥10%."
     }
 
+def score2_intervention_flag_batch(ages, score2) -> Tuple[np.ndarray, np.ndarray]:
+    """Vektoriseret udgave af score2_intervention_flag til kohorte-scoring.
+
+    ages og score2 er array-likes af samme længde. Returnerer (thresholds, flags):
+    thresholds er NaN uden for det validerede aldersinterval 40-75, og flags er
+    False dér (sammenligning mod NaN er altid False).
+    """
+    ages = np.asarray(ages)
+    score2 = np.asarray(score2, dtype=float)
+    th = _TH_TABLE[np.clip(ages, 0, _TH_TABLE.shape[0] - 1).astype(np.intp)].astype(float)
+    with np.errstate(invalid="ignore"):
+        flags = score2 >= th
+    return th, flags
+
 # ------------------ Medication rules engine ------------------
 
+# Genbrugte klasse-strenge som modulkonstanter: samme objekt alle steder,
+# så dedup-sammenligninger bliver pointer-checks.
+FIRST_LINE_ACE_ARB = "ACE-hæmmer eller ARB"
+AVOID_THIAZIDE = "Tiazid(-lign.) diuretikum"
+
+class F:
+    """Prædikat-bits for regelmotoren: labs (binned) + komorbiditeter.
+
+    Én patient-tilstand er ét int-bitmask — billigt at hashe og at teste
+    med AND i regeltabellen nedenfor.
+    """
+    K_HIGH        = 1 << 0
+    K_LOW         = 1 << 1
+    NA_LOW        = 1 << 2
+    EGFR_LT30     = 1 << 3
+    EGFR_LT60     = 1 << 4
+    GOUT_RISK     = 1 << 5
+    DIABETES      = 1 << 6
+    CKD           = 1 << 7
+    PROTEINURIA   = 1 << 8
+    CAD           = 1 << 9
+    STROKE_TIA    = 1 << 10
+    HEART_FAILURE = 1 << 11
+    AF            = 1 << 12
+    PREGNANCY     = 1 << 13
+    ASTHMA_COPD   = 1 << 14
+    EDEMA         = 1 << 15
+    EGFR_KNOWN    = 1 << 16  # eGFR målt; CKD/proteinuri-reglen kræver kendt nyrefunktion
+
+# Attribut→bit-tabel til pakning af Patient-bools; kendt urinsyregigt deler
+# GOUT_RISK-bitten med det lab-afledte urat-kriterium.
+_FLAG_ATTRS = (
+    ("diabetes", F.DIABETES),
+    ("ckd", F.CKD),
+    ("proteinuria", F.PROTEINURIA),
+    ("cad", F.CAD),
+    ("stroke_tia", F.STROKE_TIA),
+    ("heart_failure", F.HEART_FAILURE),
+    ("af", F.AF),
+    ("pregnancy", F.PREGNANCY),
+    ("asthma_copd", F.ASTHMA_COPD),
+    ("peripheral_edema_tendency", F.EDEMA),
+    ("gout", F.GOUT_RISK),
+)
+
+# Regeltabel: (any_mask, none_mask, all_mask, first_line, avoid, rationales).
+# En regel udløses når mindst én bit i any_mask er sat, ingen i none_mask,
+# og alle bits i all_mask. Rækkefølgen afgør præsentationsrækkefølgen af
+# first_line/rationales.
+_RULES: Tuple[Tuple[int, int, int, Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]], ...] = (
+    (F.K_HIGH, 0, 0,
+     (),
+     ("ACE-hæmmer (midlertidigt/individuelt)", "ARB (midlertidigt/individuelt)", "K+-besparende diuretika (fx spironolakton)"),
+     ("Hyperkaliæmi øger risiko ved ACE/ARB/K+-besparende; korrigér K+ og vurder årsag først.",)),
+    # thiazides can worsen K+, so caution (kun når K+ ikke allerede er høj)
+    (F.K_LOW, F.K_HIGH, 0,
+     (),
+     ("Tiazid(-lign.) diuretikum som monoterapi (overvej kombination med ACE/ARB eller K+-tilskud/kost)",),
+     ("Hypokaliæmi kan forværres af tiazider; korrigér og/eller kombiner for at balancere K+.",)),
+    (F.NA_LOW, 0, 0,
+     (),
+     (AVOID_THIAZIDE,),
+     ("Hyponatriæmi kan forværres af tiazider; undgå tilstanden er korrigeret.",)),
+    (F.EGFR_LT30, 0, 0,
+     (),
+     ("Tiazid(-lign.) diuretikum (nedsat effekt ved eGFR <30)", "K+-besparende diuretika (forsigtighed)"),
+     ("Tiazider er ofte ineffektive ved eGFR <30; overvej loop-diuretika ved volumenoverload.",)),
+    # CKD/proteinuri udløser kun nefroprotektion når eGFR er målt
+    (F.EGFR_LT60 | F.CKD | F.PROTEINURIA, 0, F.EGFR_KNOWN,
+     ("ACE-hæmmer eller ARB (nefroprotektion ved proteinuri/CKD)",),
+     (),
+     ("ACE/ARB reducerer albuminuri og beskytter nyrefunktion. Monitorér kreatinin/K+.",)),
+    (F.DIABETES, 0, 0,
+     ("ACE-hæmmer eller ARB (især ved albuminuri)",),
+     (),
+     ("Ved diabetes og albuminuri anbefales RAAS-blokade som grundstamme.",)),
+    (F.CAD | F.STROKE_TIA, 0, 0,
+     (FIRST_LINE_ACE_ARB, "DHP-CCB (amlodipin)"),
+     (),
+     ("Sekundærprofylakse: RAAS-blokade og/eller CCB har outcome-data; beta-blokker ved angina/post-MI.",)),
+    (F.HEART_FAILURE, 0, 0,
+     (FIRST_LINE_ACE_ARB, "Beta-blokker (HF-udgave)", "Mineralokortikoid-antagonist (ved HFrEF og efter K+/nyrer)"),
+     (),
+     ("HFrEF: livsforlængende behandling. Vurder ejection fraction og guideline-specifik titrering.",)),
+    (F.AF, 0, 0,
+     ("Beta-blokker (hvis frekvenskontrol ønskes)",),
+     (),
+     ("AF: beta-blokker kan være hensigtsmæssig ved behov for frekvenskontrol.",)),
+    (F.GOUT_RISK, 0, 0,
+     (),
+     (AVOID_THIAZIDE,),
+     ("Tiazider kan øge urinsyre og trigge urinsyregigt.",)),
+    (F.ASTHMA_COPD, 0, 0,
+     (),
+     ("Ikke-selektive beta-blokkere",),
+     ("Bronkokonstriktionsrisiko ved ikke-selektive beta-blokkere.",)),
+    (F.EDEMA, 0, 0,
+     (),
+     ("DHP-CCB som monoterapi (overvej kombination med ACE/ARB)",),
+     ("Amlodipin kan give ankelsvulst; RAAS-kombination reducerer risiko.",)),
+    (F.PREGNANCY, 0, 0,
+     ("Labetalol", "Nifedipin (retard)", "Methyldopa"),
+     ("ACE-hæmmer", "ARB", "MRA (spironolakton/eplerenon)"),
+     ("Graviditet: undgå RAAS-blokade. Foretræk labetalol, nifedipin (retard) eller methyldopa.",)),
+)
+
+# Default-førstevalg når ingen regel har sat noget
+_DEFAULT_FIRST_LINE = (
+    "ACE-hæmmer ELLER ARB",
+    "DHP-CCB (amlodipin)",
+    "Tiazid-lignende diuretikum (indapamid/klortalidon)",
+)
+
+# Interned output-strenge: hver distinkt streng får ét indeks per kategori,
+# og reglerne kompileres til bitsets over disse indeks. Regeludløsning
+# akkumulerer så tre ints (OR er idempotent = gratis dedup) i stedet for
+# liste-appends + set-hashing af lange danske strenge.
+def _intern_rule_outputs():
+    fl, av, rat = [], [], []
+    for _any, _none, _all, f, a, r in _RULES:
+        fl.extend(f)
+        av.extend(a)
+        rat.extend(r)
+    fl.extend(_DEFAULT_FIRST_LINE)
+    return tuple(dict.fromkeys(fl)), tuple(dict.fromkeys(av)), tuple(dict.fromkeys(rat))
+
+FIRST_LINE_STRINGS, AVOID_STRINGS, RATIONALE_STRINGS = _intern_rule_outputs()
+
+def _pack_bits(strings, index):
+    mask = 0
+    for s in strings:
+        mask |= 1 << index[s]
+    return mask
+
+_FL_IDX = {s: i for i, s in enumerate(FIRST_LINE_STRINGS)}
+_AV_IDX = {s: i for i, s in enumerate(AVOID_STRINGS)}
+_RAT_IDX = {s: i for i, s in enumerate(RATIONALE_STRINGS)}
+
+# Skønnet andel af AP-hypertonikere der udløser hver regel (samme orden som
+# _RULES); klinikervurdering som udgangspunkt, kan erstattes af logfrekvenser.
+_RULE_FREQ = (
+    0.05,   # K_HIGH
+    0.04,   # K_LOW
+    0.05,   # NA_LOW
+    0.03,   # eGFR <30
+    0.25,   # eGFR <60 / CKD / proteinuri
+    0.20,   # diabetes
+    0.15,   # CAD / apopleksi-TIA
+    0.04,   # hjertesvigt
+    0.08,   # AF
+    0.07,   # urinsyregigt/højt urat
+    0.10,   # astma/COPD
+    0.05,   # ødem-tendens
+    0.005,  # graviditet
+)
+
+# (any_mask, none_mask, all_mask, fl_bits, av_bits, rat_bits) per regel —
+# sorteret med hyppigst udløste regler først (grenforudsigelses-venligt ved
+# cache-miss). OR-akkumulationen er ordensuafhængig, og præsentations-
+# rækkefølgen styres af interning-indeksene ovenfor, så output er uændret.
+_RULES_BITS = tuple(
+    rule
+    for _freq, rule in sorted(
+        zip(
+            _RULE_FREQ,
+            (
+                (any_mask, none_mask, all_mask, _pack_bits(fl, _FL_IDX), _pack_bits(av, _AV_IDX), _pack_bits(rat, _RAT_IDX))
+                for any_mask, none_mask, all_mask, fl, av, rat in _RULES
+            ),
+        ),
+        key=lambda t: t[0],
+        reverse=True,
+    )
+)
+
+def _emit(mask: int, table: Tuple[str, ...]) -> Tuple[str, ...]:
+    # Set bits i indeks-orden = interning-orden = regel-rækkefølgen
+    return tuple(table[i] for i in range(mask.bit_length()) if (mask >> i) & 1)
+
+# Regeltabellens masker som arrays til batch-kernen nedenfor
+_RULE_ANY_MASKS = np.array([r[0] for r in _RULES], dtype=np.uint32)
+_RULE_NONE_MASKS = np.array([r[1] for r in _RULES], dtype=np.uint32)
+_RULE_ALL_MASKS = np.array([r[2] for r in _RULES], dtype=np.uint32)
+
+def patient_bits_batch(k, na, egfr, urate, flags) -> np.ndarray:
+    """Binner lab-arrays (NaN = ukendt) og OR'er dem ind i flag-bitmasks.
+
+    flags er et uint32-array med komorbiditetsbits i F-positionerne (inkl.
+    GOUT_RISK for kendt urinsyregigt). NaN-sammenligninger er False, så
+    manglende labs sætter ingen bits — samme semantik som den skalare sti.
+    """
+    k = np.asarray(k, dtype=float)
+    na = np.asarray(na, dtype=float)
+    egfr = np.asarray(egfr, dtype=float)
+    urate = np.asarray(urate, dtype=float)
+    bits = np.asarray(flags, dtype=np.uint32).copy()
+    with np.errstate(invalid="ignore"):
+        bits |= np.where(k >= 5.0, F.K_HIGH, 0).astype(np.uint32)
+        bits |= np.where(k <= 3.4, F.K_LOW, 0).astype(np.uint32)
+        bits |= np.where(na <= 133, F.NA_LOW, 0).astype(np.uint32)
+        bits |= np.where(~np.isnan(egfr), F.EGFR_KNOWN, 0).astype(np.uint32)
+        bits |= np.where(egfr < 30, F.EGFR_LT30, 0).astype(np.uint32)
+        bits |= np.where(egfr < 60, F.EGFR_LT60, 0).astype(np.uint32)
+        bits |= np.where(urate > 0.42, F.GOUT_RISK, 0).astype(np.uint32)
+    return bits
+
+def med_rule_masks_batch(bits) -> np.ndarray:
+    """Afgør hvilke regler i _RULES der udløses for hver patient.
+
+    bits er et uint32-array af prædikat-bitmasks (se patient_bits_batch);
+    resultatet er et uint32-array hvor bit r er sat når regel r udløses.
+    Strengene materialiseres først når en enkelt patients anbefaling vises
+    (via _med_recommendations_cached)."""
+    bits = np.ascontiguousarray(bits, dtype=np.uint32)
+    return _rules_kernel(bits, _RULE_ANY_MASKS, _RULE_NONE_MASKS, _RULE_ALL_MASKS)
+
+def _rules_kernel(bits, any_masks, none_masks, all_masks):
+    # NumPy-fallback: broadcast (n, regler) og pak kolonnerne til én maske
+    hit = (
+        ((bits[:, None] & any_masks) != 0)
+        & ((bits[:, None] & none_masks) == 0)
+        & ((bits[:, None] & all_masks) == all_masks)
+    )
+    weights = (np.uint32(1) << np.arange(any_masks.shape[0], dtype=np.uint32))
+    return (hit * weights).sum(axis=1).astype(np.uint32)
+
+# JIT med parallel prange hvis numba er installeret; ellers NumPy-fallback.
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, cache=True)
+    def _rules_kernel(bits, any_masks, none_masks, all_masks):
+        n = bits.shape[0]
+        n_rules = any_masks.shape[0]
+        out = np.zeros(n, dtype=np.uint32)
+        for i in prange(n):
+            b = bits[i]
+            acc = np.uint32(0)
+            for r in range(n_rules):
+                if (b & any_masks[r]) != 0 and (b & none_masks[r]) == 0 and (b & all_masks[r]) == all_masks[r]:
+                    acc |= np.uint32(1) << np.uint32(r)
+            out[i] = acc
+        return out
+except ImportError:
+    pass
+
+# Kvantiserede lab-kolonner: uint8 med 255 som "ukendt"-sentinel
+_LAB_Q_MISSING = np.uint8(255)
+
+def _quantize_lab(values, scale: float) -> np.ndarray:
+    """Kvantiser en lab-kolonne til uint8 (NaN → sentinel 255, klippet til 0-254)."""
+    arr = np.asarray(values, dtype=float) * scale
+    out = np.full(arr.shape, _LAB_Q_MISSING, dtype=np.uint8)
+    valid = ~np.isnan(arr)
+    out[valid] = np.clip(np.round(arr[valid]), 0, 254).astype(np.uint8)
+    return out
+
+def patient_bits_batch_q(k_q, na_q, egfr_q, urate_q, flags) -> np.ndarray:
+    """Som patient_bits_batch, men på kvantiserede uint8-kolonner (255 = ukendt).
+
+    Tærsklerne er eksakte på heltalsgitteret (K ×10, urat ×100), og kernen
+    læser 1 byte pr. lab i stedet for 8 — kvart så meget båndbredde.
+    """
+    bits = np.asarray(flags, dtype=np.uint32).copy()
+    k_ok = k_q != _LAB_Q_MISSING
+    bits |= np.where(k_ok & (k_q >= 50), F.K_HIGH, 0).astype(np.uint32)
+    bits |= np.where(k_ok & (k_q <= 34), F.K_LOW, 0).astype(np.uint32)
+    bits |= np.where((na_q != _LAB_Q_MISSING) & (na_q <= 133), F.NA_LOW, 0).astype(np.uint32)
+    e_ok = egfr_q != _LAB_Q_MISSING
+    bits |= np.where(e_ok, F.EGFR_KNOWN, 0).astype(np.uint32)
+    bits |= np.where(e_ok & (egfr_q < 30), F.EGFR_LT30, 0).astype(np.uint32)
+    bits |= np.where(e_ok & (egfr_q < 60), F.EGFR_LT60, 0).astype(np.uint32)
+    bits |= np.where((urate_q != _LAB_Q_MISSING) & (urate_q > 42), F.GOUT_RISK, 0).astype(np.uint32)
+    return bits
+
+@dataclass(slots=True)
+class PatientBatch:
+    """SoA-kohorte: parallelle NumPy-kolonner i stedet for N Patient-objekter.
+
+    Kolonnerne ligger kontiguøst pr. felt, så batch-kernerne læser sekventielt
+    i stedet for at dereferere 18 attributter pr. objekt. Labs er kvantiseret
+    til uint8 (K ×10, Na ×1, eGFR ×1, urat ×100; 255 = ukendt) — klinisk
+    irrelevant præcisionstab, eksakte heltals-tærskler.
+    """
+    age: np.ndarray     # int16
+    sbp: np.ndarray     # int16, -1 = ukendt
+    score2: np.ndarray  # float32, NaN = ukendt
+    k_q: np.ndarray     # uint8, K+ i 0.1 mmol/L
+    na_q: np.ndarray    # uint8, Na+ i mmol/L
+    egfr_q: np.ndarray  # uint8, mL/min/1.73m2
+    urate_q: np.ndarray # uint8, urat i 0.01 mmol/L
+    flags: np.ndarray   # uint32 (F-bits for komorbiditeter)
+
+    @classmethod
+    def from_patients(cls, patients: List[Patient]) -> "PatientBatch":
+        def col(attr, dtype, missing):
+            return np.array(
+                [missing if getattr(p, attr) is None else getattr(p, attr) for p in patients],
+                dtype=dtype,
+            )
+        def labcol(attr, scale):
+            return _quantize_lab(
+                [np.nan if getattr(p, attr) is None else getattr(p, attr) for p in patients],
+                scale,
+            )
+        return cls(
+            age=np.array([p.age for p in patients], dtype=np.int16),
+            sbp=col("sbp", np.int16, -1),
+            score2=col("score2_pct", np.float32, np.nan),
+            k_q=labcol("k", 10.0),
+            na_q=labcol("na", 1.0),
+            egfr_q=labcol("egfr", 1.0),
+            urate_q=labcol("urate", 100.0),
+            flags=np.array([p.flags for p in patients], dtype=np.uint32),
+        )
+
+    def intervention_flags(self) -> Tuple[np.ndarray, np.ndarray]:
+        return score2_intervention_flag_batch(self.age, self.score2)
+
+    def bits(self) -> np.ndarray:
+        return patient_bits_batch_q(self.k_q, self.na_q, self.egfr_q, self.urate_q, self.flags)
+
+    def rule_masks(self) -> np.ndarray:
+        return med_rule_masks_batch(self.bits())
+
+def _lab_bits(p: Patient) -> int:
+    """Bin kontinuerte labs til prædikat-bits i ét gennemløb (én None-test pr. lab)."""
+    b = 0
+    k = p.k
+    if k is not None:
+        if k >= 5.0:
+            b |= F.K_HIGH
+        elif k <= 3.4:
+            b |= F.K_LOW
+    na = p.na
+    if na is not None and na <= 133:
+        b |= F.NA_LOW
+    egfr = p.egfr
+    if egfr is not None:
+        b |= F.EGFR_KNOWN
+        if egfr < 60:
+            b |= F.EGFR_LT60 | (F.EGFR_LT30 if egfr < 30 else 0)
+    urate = p.urate
+    if urate is not None and urate > 0.42:  # mmol/L example threshold
+        b |= F.GOUT_RISK
+    return b
+
+def med_recommendations_view(p: Patient) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Allokeringsfri variant til batch-kørsler: returnerer den memoiserede
+    (first_line, combinations, avoid, rationales)-tupel direkte. Tuplerne
+    deles mellem kald og må ikke muteres; brug med_recommendations() hvis
+    der skal arbejdes videre på resultatet.
+    """
+    # Flags + lab-prædikater som ét bitmask; nøglen er ét int, så gentagne
+    # kald i den memoiserede kerne er et dict-opslag.
+    return _med_recommendations_cached(p.flags | _lab_bits(p))
+
 def med_recommendations(p: Patient) -> Dict[str, List[str]]:
     """
     Returns a dict with keys:
@@ -87,131 +478,132 @@ def med_recommendations(p: Patient) -> Dict[str, List[str]]:
       - 'avoid_or_caution': list of warnings/avoidance items
       - 'rationales': list of short rationales
     """
-    first_line = []
-    combos = []
-    avoid = []
-    rationales = []
+    first_line, combos, avoid, rationales = med_recommendations_view(p)
+    return {
+        "first_line_options": list(first_line),
+        "combinations": list(combos),
+        "avoid_or_caution": list(avoid),
+        "rationales": list(rationales),
+    }
 
+# Combination suggestions (typiske, evidensbaserede) — uafhængige af patienten
+_STATIC_COMBOS = (
+    "ACE-hæmmer/ARB + DHP-CCB",
+    "ACE-hæmmer/ARB + tiazid-lignende diuretikum",
+    "DHP-CCB + tiazid-lignende diuretikum (hvis RAAS-blokade ikke tåles)",
+)
+
+# Lab-afledte bits (sat af _lab_bits); resten af masken er komorbiditets-profilen
+_LAB_MASK = int(F.K_HIGH | F.K_LOW | F.NA_LOW | F.EGFR_KNOWN | F.EGFR_LT30 | F.EGFR_LT60 | F.GOUT_RISK)
+
+@lru_cache(maxsize=256)
+def _specialized_rules(profile_bits: int) -> Tuple[Tuple[int, int, int, int, int, int], ...]:
+    """Delmængden af _RULES_BITS der overhovedet kan udløses for en profil.
+
+    Partial evaluation pr. komorbiditets-bucket: en regel er død for hele
+    bucket'en hvis dens none-maske allerede rammer profilen, hvis dens
+    any-maske hverken kan rammes af profilen eller af lab-bits, eller hvis
+    dens all-maske kræver bits der aldrig kan sættes. Filtreres én gang pr.
+    bucket og genbruges på tværs af lab-variation.
+    """
+    reachable = profile_bits | _LAB_MASK
+    return tuple(
+        rule for rule in _RULES_BITS
+        if (rule[0] & reachable) and not (profile_bits & rule[1]) and not (rule[2] & ~reachable)
+    )
+
+@lru_cache(maxsize=2048)
+def _med_recommendations_cached(bits: int) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
     # Baseline first-line classes often used in DK/ESC contexts:
     # Thiazide-like diuretic (indapamid or chlortalidon), ACE-hæmmer, ARB, dihydropyridin-CCB (amlodipin).
     # Beta-blokkere ved særlige indikationer (fx post-MI, angina, AF, migræne, tremor), ikke rutineførstevalg alene.
 
-    # --- Lab- and comorbidity-driven adjustments ---
-
-    # Potassium
-    if p.k is not None:
-        if p.k >= 5.0:
-            avoid += ["ACE-hæmmer (midlertidigt/individuelt)", "ARB (midlertidigt/individuelt)", "K+-besparende diuretika (fx spironolakton)"]
-            rationales += ["Hyperkaliæmi øger risiko ved ACE/ARB/K+-besparende; korrigér K+ og vurder årsag først."]
-        elif p.k <= 3.4:
-            # thiazides can worsen K+, so caution
-            avoid += ["Tiazid(-lign.) diuretikum som monoterapi (overvej kombination med ACE/ARB eller K+-tilskud/kost)"]
-            rationales += ["Hypokaliæmi kan forværres af tiazider; korrigér og/eller kombiner for at balancere K+."]
-
-    # Sodium
-    if p.na is not None and p.na <= 133:
-        avoid += ["Tiazid(-lign.) diuretikum"]
-        rationales += ["Hyponatriæmi kan forværres af tiazider; undgå tilstanden er korrigeret."]
-
-    # eGFR/CKD
-    if p.egfr is not None:
-        if p.egfr < 30:
-            avoid += ["Tiazid(-lign.) diuretikum (nedsat effekt ved eGFR <30)", "K+-besparende diuretika (forsigtighed)"]
-            rationales += ["Tiazider er ofte ineffektive ved eGFR <30; overvej loop-diuretika ved volumenoverload."]
-        if p.egfr < 60 or p.ckd or p.proteinuria:
-            first_line += ["ACE-hæmmer eller ARB (nefroprotektion ved proteinuri/CKD)"]
-            rationales += ["ACE/ARB reducerer albuminuri og beskytter nyrefunktion. Monitorér kreatinin/K+."]
-
-    # Diabetes
-    if p.diabetes:
-        first_line += ["ACE-hæmmer eller ARB (især ved albuminuri)"]
-        rationales += ["Ved diabetes og albuminuri anbefales RAAS-blokade som grundstamme."]
-
-    # CAD/Stroke/Atherosclerotic CVD
-    if p.cad or p.stroke_tia:
-        first_line += ["ACE-hæmmer eller ARB", "DHP-CCB (amlodipin)"]
-        rationales += ["Sekundærprofylakse: RAAS-blokade og/eller CCB har outcome-data; beta-blokker ved angina/post-MI."]
-
-    # Heart failure
-    if p.heart_failure:
-        first_line += ["ACE-hæmmer eller ARB", "Beta-blokker (HF-udgave)", "Mineralokortikoid-antagonist (ved HFrEF og efter K+/nyrer)"]
-        rationales += ["HFrEF: livsforlængende behandling. Vurder ejection fraction og guideline-specifik titrering."]
-
-    # AF
-    if p.af:
-        first_line += ["Beta-blokker (hvis frekvenskontrol ønskes)"]
-        rationales += ["AF: beta-blokker kan være hensigtsmæssig ved behov for frekvenskontrol."]
-
-    # Gout/urate
-    if p.gout or (p.urate is not None and p.urate > 0.42):  # mmol/L example threshold
-        avoid += ["Tiazid(-lign.) diuretikum"]
-        rationales += ["Tiazider kan øge urinsyre og trigge urinsyregigt."]
-
-    # Asthma/COPD
-    if p.asthma_copd:
-        avoid += ["Ikke-selektive beta-blokkere"]
-        rationales += ["Bronkokonstriktionsrisiko ved ikke-selektive beta-blokkere."]
-
-    # Edema tendency
-    if p.peripheral_edema_tendency:
-        avoid += ["DHP-CCB som monoterapi (overvej kombination med ACE/ARB)"]
-        rationales += ["Amlodipin kan give ankelsvulst; RAAS-kombination reducerer risiko."]
-
-    # Pregnancy
-    if p.pregnancy:
-        avoid += ["ACE-hæmmer", "ARB", "MRA (spironolakton/eplerenon)"]
-        first_line += ["Labetalol", "Nifedipin (retard)", "Methyldopa"]
-        rationales += ["Graviditet: undgå RAAS-blokade. Foretræk labetalol, nifedipin (retard) eller methyldopa."]
-
-    # Default first-line if none added yet
-    if not first_line:
-        first_line += ["ACE-hæmmer ELLER ARB", "DHP-CCB (amlodipin)", "Tiazid-lignende diuretikum (indapamid/klortalidon)"]
-
-    # Combination suggestions (typiske, evidensbaserede)
-    combos += [
-        "ACE-hæmmer/ARB + DHP-CCB",
-        "ACE-hæmmer/ARB + tiazid-lignende diuretikum",
-        "DHP-CCB + tiazid-lignende diuretikum (hvis RAAS-blokade ikke tåles)"
-    ]
+    # Regeludløsning akkumulerer tre bitsets; strengene materialiseres først
+    # til sidst via opslagstabellerne.
+    fl_bits = av_bits = rat_bits = 0
+    for any_mask, none_mask, all_mask, flb, avb, ratb in _specialized_rules(bits & ~_LAB_MASK):
+        if (bits & any_mask) and not (bits & none_mask) and (bits & all_mask) == all_mask:
+            fl_bits |= flb
+            av_bits |= avb
+            rat_bits |= ratb
+
+    # Default first-line if none added yet (i deklarationsrækkefølge, ikke
+    # interning-rækkefølge, da DHP-CCB-strengen også optræder i en regel)
+    first_line = _emit(fl_bits, FIRST_LINE_STRINGS) if fl_bits else _DEFAULT_FIRST_LINE
+
+    return (
+        first_line,
+        _STATIC_COMBOS,
+        tuple(sorted(_emit(av_bits, AVOID_STRINGS))),
+        _emit(rat_bits, RATIONALE_STRINGS),
+    )
 
-    # Remove duplicates while preserving order
-    def unique(seq):
-        seen = set()
-        out = []
-        for x in seq:
-            if x not in seen:
-                out.append(x); seen.add(x)
-        return out
+# ------------------ Simple CLI demo ------------------
 
-    return {
-        "first_line_options": unique(first_line),
-        "combinations": unique(combos),
-        "avoid_or_caution": unique(avoid),
-        "rationales": unique(rationales),
-    }
+_FLAG_FIELDS = tuple(attr for attr, _bit in _FLAG_ATTRS)
+
+def _parse_patient(d: Dict[str, object]) -> Patient:
+    """Byg en Patient fra en række (dict); tomme strenge/NaN tolkes som None."""
+    def _opt_float(key):
+        v = d.get(key)
+        if v is None or v == "" or (isinstance(v, float) and v != v):
+            return None
+        return float(v)
+    def _flag(key):
+        v = d.get(key, False)
+        return bool(v) and v == v  # NaN fra pandas tæller som False
+    sbp = _opt_float("sbp")
+    return Patient(
+        age=int(d["age"]),
+        sex=str(d.get("sex", "F")).upper().strip(),
+        sbp=int(sbp) if sbp is not None else None,
+        score2_pct=_opt_float("score2_pct"),
+        na=_opt_float("na"), k=_opt_float("k"),
+        egfr=_opt_float("egfr"), urate=_opt_float("urate"),
+        **{name: _flag(name) for name in _FLAG_FIELDS},
+    )
 
-# ------------------ Simple CLI demo ------------------
+def run_batch(csv_path: str) -> List[Dict[str, object]]:
+    """
+    Kør scorer + regelmotor over en CSV med én patient pr. række
+    (kolonner som Patient-felterne). Én buffered læsning og den
+    vektoriserede tærskel-kerne i stedet for 18 input()-kald pr. patient.
+    """
+    import pandas as pd  # kun nødvendig for batch-kørsel
+
+    df = pd.read_csv(csv_path)
+    ths, flags = score2_intervention_flag_batch(
+        df["age"].to_numpy(dtype=np.float64),
+        df["score2_pct"].to_numpy(dtype=np.float64),
+    )
+    results: List[Dict[str, object]] = []
+    for i, row in enumerate(df.to_dict("records")):
+        out = med_recommendations(_parse_patient(row))
+        out["threshold"] = float(ths[i]) if ths[i] == ths[i] else None
+        out["intervention_recommended"] = bool(flags[i])
+        results.append(out)
+    return results
+
+# Accepterede ja-svar; én prækompileret DFA i stedet for lower/strip/== pr. svar
+_YES = re.compile(r"^\s*(?:j|ja|jo|y|yes)\s*$", re.IGNORECASE)
 
 def demo():
     print("=== Hypertension demo (teaching prototype) ===")
-    age = int(input("Alder (år): "))
-    sex = input("Køn [F/M]: ").upper().strip()
-    sbp = int(input("Systolisk BT (mmHg): "))
-    score2_str = input("SCORE2 % (indtast tallet aflæst fra DSAM/ESC-tabellen, fx 7): ").strip()
-    score2 = float(score2_str) if score2_str else None
-
-    # Labs (optional)
-    na = input("Na+ (mmol/L) [tom hvis ukendt]: "); na = float(na) if na else None
-    k  = input("K+ (mmol/L) [tom hvis ukendt]: "); k  = float(k) if k else None
-    egfr = input("eGFR (mL/min/1.73m2) [tom hvis ukendt]: "); egfr = float(egfr) if egfr else None
-    urate = input("Urat (mmol/L) [tom hvis ukendt]: "); urate = float(urate) if urate else None
-
-    # Flags
-    def yesno(q):
-        ans = input(q + " [j/n]: ").lower().strip()
-        return ans == 'j'
 
-    flags = {
+    def yesno(q):
+        return bool(_YES.match(input(q + " [j/n]: ")))
+
+    d = {
+        "age": input("Alder (år): "),
+        "sex": input("Køn [F/M]: "),
+        "sbp": input("Systolisk BT (mmHg): "),
+        "score2_pct": input("SCORE2 % (indtast tallet aflæst fra DSAM/ESC-tabellen, fx 7): ").strip(),
+        # Labs (optional)
+        "na": input("Na+ (mmol/L) [tom hvis ukendt]: "),
+        "k": input("K+ (mmol/L) [tom hvis ukendt]: "),
+        "egfr": input("eGFR (mL/min/1.73m2) [tom hvis ukendt]: "),
+        "urate": input("Urat (mmol/L) [tom hvis ukendt]: "),
+        # Flags
         "diabetes": yesno("Diabetes?"),
         "ckd": yesno("Kronisk nyresygdom (CKD)?"),
         "cad": yesno("Kendt iskæmisk hjertesygdom?"),
@@ -224,39 +616,39 @@ def demo():
         "peripheral_edema_tendency": yesno("Tendens til perifere ødemer?"),
         "proteinuria": yesno("Betydende albuminuri/proteinuri?"),
     }
+    p = _parse_patient(d)
 
-    p = Patient(
-        age=age, sex=sex, sbp=sbp, score2_pct=score2,
-        na=na, k=k, egfr=egfr, urate=urate,
-        **flags
-    )
-
-    print("\n--- SCORE2 og interventionsgrænse ---")
+    # Saml hele rapporten og skriv den i ét kald: én stdout-lås, én flush
     s2 = score2_intervention_flag(p)
-    print(f"Interventionsgrænse (alder): {s2['threshold']}")
-    print(f"Over grænsen? {s2['intervention_recommended']}")
-    print(f"Note: {s2['note']}")
-
-    print("\n--- Medicinforslag (klasser) ---")
     out = med_recommendations(p)
-    print("Førstevalg (klasser):")
-    for x in out["first_line_options"]:
-        print(" -", x)
+    lines = [
+        "",
+        "--- SCORE2 og interventionsgrænse ---",
+        f"Interventionsgrænse (alder): {s2['threshold']}",
+        f"Over grænsen? {s2['intervention_recommended']}",
+        f"Note: {s2['note']}",
+        "",
+        "--- Medicinforslag (klasser) ---",
+        "Førstevalg (klasser):",
+    ]
+    lines.extend(f" - {x}" for x in out["first_line_options"])
 
-    print("\nKombinationer (eksempler):")
-    for x in out["combinations"]:
-        print(" -", x)
+    lines.append("")
+    lines.append("Kombinationer (eksempler):")
+    lines.extend(f" - {x}" for x in out["combinations"])
 
-    print("\nUndgå/forsigtighed:")
+    lines.append("")
+    lines.append("Undgå/forsigtighed:")
     if out["avoid_or_caution"]:
-        for x in out["avoid_or_caution"]:
-            print(" -", x)
+        lines.extend(f" - {x}" for x in out["avoid_or_caution"])
     else:
-        print(" - (ingen specifikke)")
+        lines.append(" - (ingen specifikke)")
+
+    lines.append("")
+    lines.append("Rationaler (kort):")
+    lines.extend(f" - {x}" for x in out["rationales"])
 
-    print("\nRationaler (kort):")
-    for x in out["rationales"]:
-        print(" -", x)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 if __name__ == "__main__":
     demo()
@@ -0,0 +1,67 @@
+"""
+score2_kernels.py — Numeriske SCORE2-kerner for app.py.
+
+Kernerne ligger i deres eget modul uden Streamlit-import: numbas on-disk
+cache (cache=True) registrerer det definerende modul og genimporterer det
+ved cache-hit. Lå kernerne i app.py, ville et cache-hit re-eksekvere hele
+Streamlit-scriptet (widgets m.m.) midt i indlæsningen.
+"""
+
+import math
+
+import numpy as np
+
+
+def score2_scalar_kernel(
+    cage: float, csbp: float, ctc: float, chdl: float, csmoke: float,
+    c_cage: float, c_csbp: float, c_ctc: float, c_chdl: float, c_smoke: float,
+    c_cage_csbp: float, c_cage_ctc: float, c_cage_chdl: float, c_cage_smoke: float,
+    ln_negln_s0: float, scale1: float, scale2: float,
+) -> float:
+    # Ren skalar-FP uden Python-objekter: kan JIT-kompileres af numba uændret.
+    lp = (
+        c_cage * cage
+        + c_csbp * csbp
+        + c_ctc * ctc
+        + c_chdl * chdl
+        + c_smoke * csmoke
+        + c_cage_csbp * cage * csbp
+        + c_cage_ctc * cage * ctc
+        + c_cage_chdl * cage * chdl
+        + c_cage_smoke * cage * csmoke
+    )
+    # Fusioneret kalibrering: log(-log(1-risk_uncal)) == log(-log(s0)) + lp,
+    # så mellemtrinnet 1-exp(...) inkl. clamp og et exp/log-par udgår.
+    # -expm1(-x) == 1-exp(-x) uden cancellation ved meget lille risiko.
+    risk_cal = -math.expm1(-math.exp(scale1 + scale2 * (ln_negln_s0 + lp)))
+    return 100.0 * min(max(risk_cal, 0.0), 0.9999)
+
+
+def score2_batch_kernel(coefs, feats_t, ln_negln_s0, scale1, scale2):
+    # NumPy-fallback uden numba: lp som matrix-vektor-produkt + ufuncs.
+    lp = feats_t @ coefs
+    risk_cal = -np.expm1(-np.exp(scale1 + scale2 * (ln_negln_s0 + lp)))
+    return 100.0 * np.clip(risk_cal, 0.0, 0.9999)
+
+
+# JIT hvis numba er installeret; ellers kører kernerne som ren Python/NumPy.
+try:
+    from numba import njit
+
+    score2_scalar_kernel = njit(cache=True)(score2_scalar_kernel)
+
+    # Batch-kernen som eksplicit løkke: LLVM kan så SIMD-vektorisere både
+    # dot-produktet og exp-kæden uden NumPy's mellemliggende arrays.
+    @njit(fastmath=True, cache=True)
+    def score2_batch_kernel(coefs, feats_t, ln_negln_s0, scale1, scale2):
+        n = feats_t.shape[0]
+        out = np.empty(n)
+        for i in range(n):
+            lp = 0.0
+            for j in range(9):
+                lp += coefs[j] * feats_t[i, j]
+            risk_cal = -math.expm1(-math.exp(scale1 + scale2 * (ln_negln_s0 + lp)))
+            out[i] = 100.0 * min(max(risk_cal, 0.0), 0.9999)
+        return out
+except ImportError:
+    pass